@@ -89,8 +89,12 @@ def run(options):
 
     p = beam.Pipeline(options=options)
 
-    fishing_vessels = p | beam.io.ReadFromText(known_args.fishing_ssvid_list)
-    fishing_vessel_list = beam.pvalue.AsList(fishing_vessels)
+    fishing_vessels = (p 
+        | beam.io.ReadFromText(known_args.fishing_ssvid_list)
+        | beam.combiners.ToList()
+        | beam.Map(frozenset)
+        )
+    fishing_vessel_set = beam.pvalue.AsSingleton(fishing_vessels)
 
     source = [(p | "Source_{}".format(i) >> QuerySource(query, use_standard_sql=True))
                 for (i, query) in enumerate(queries)] | beam.Flatten()
@@ -105,7 +109,7 @@ def run(options):
         | FindAnchoragePoints(datetime.timedelta(minutes=config['stationary_period_min_duration_minutes']),
                               config['stationary_period_max_distance_km'],
                               config['min_unique_vessels_for_anchorage'],
-                              fishing_vessel_list)
+                              fishing_vessel_set)
         )
 
     (anchorage_points | AnchorageSink(table=known_args.output_table,
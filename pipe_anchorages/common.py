@@ -2,8 +2,13 @@
 from __future__ import absolute_import, print_function, division
 
 import datetime
+import functools
+import math
+import operator
 from collections import namedtuple
+import numpy as np
 import s2sphere
+from s2sphere.sphere import LOOKUP_POS, LOOKUP_BITS, SWAP_MASK, INVERT_MASK
 import six
 import yaml
 
@@ -25,32 +30,93 @@ VISITS_S2_SCALE = 9
 approx_visit_cell_size = 2.0 ** (13 - VISITS_S2_SCALE) 
 VISIT_SAFETY_FACTOR = 2.0 # Extra margin factor to ensure we don't miss ports
 
+# s2sphere's Hilbert curve lookup table, used by `s2_tokens`
+_S2_LOOKUP_POS = np.array(LOOKUP_POS, dtype=np.uint64)
+
 
 class CreateVesselRecords(beam.PTransform):
 
     def __init__(self, **defaults):
         self.defaults = defaults
 
-    def is_valid(self, item):
-        ident, rcd = item
-        assert isinstance(rcd, VesselRecord), type(rcd)
-        return (not isinstance(rcd, InvalidRecord) and 
-                isinstance(ident, six.string_types))
-
     def add_defaults(self, x):
         for k, v in self.defaults.items():
             if k not in x:
                 x[k] = v
         return x
 
+    def records_from_msg(self, msg):
+        # Adding defaults, parsing and validation in a single step, so that
+        # each message makes one trip through the Beam machinery. The ident
+        # is checked first so that no record is built for messages we drop.
+        msg = self.add_defaults(msg)
+        if not isinstance(msg['ident'], six.string_types):
+            return
+        ident, rcd = VesselRecord.tagged_from_msg(msg)
+        assert isinstance(rcd, VesselRecord), type(rcd)
+        if not isinstance(rcd, InvalidRecord):
+            yield ident, rcd
+
     def expand(self, ais_source):
         return (ais_source
-            | beam.Map(self.add_defaults)
-            | beam.Map(VesselRecord.tagged_from_msg)
-            | beam.Filter(self.is_valid)
+            | beam.FlatMap(self.records_from_msg)
         )
 
 
+_get_timestamp = operator.attrgetter('timestamp')
+
+def _record_sort_key(x):
+    return (x.timestamp, x.speed, x.location)
+
+
+class SortedUniqueRecords(beam.CombineFn):
+    """Combine a vessel's records into a list ordered by timestamp
+
+    Only the first record (by timestamp, speed, location) is kept for each
+    timestamp. Duplicates are dropped as accumulators are compacted and
+    merged, so they are removed before the shuffle rather than after it.
+    """
+
+    @staticmethod
+    def sort_and_dedup(records):
+        # Works in place on the accumulator, which the combiner owns, rather
+        # than copying the records for the sort and again for the dedup.
+        # Sorting on the timestamp alone is several times faster than on the
+        # full key; ties are rare and are resolved among themselves below.
+        records.sort(key=_get_timestamp)
+        # Duplicates are now adjacent, so compare each record with the last one kept.
+        n = 0
+        last = None
+        for rcd in records:
+            if last is not None and rcd.timestamp == last.timestamp:
+                if _record_sort_key(rcd) < _record_sort_key(last):
+                    records[n - 1] = last = rcd
+            else:
+                records[n] = last = rcd
+                n += 1
+        del records[n:]
+        return records
+
+    def create_accumulator(self):
+        return []
+
+    def add_input(self, accumulator, record):
+        accumulator.append(record)
+        return accumulator
+
+    def merge_accumulators(self, accumulators):
+        merged = []
+        for acc in accumulators:
+            merged.extend(acc)
+        return merged
+
+    def compact(self, accumulator):
+        return self.sort_and_dedup(accumulator)
+
+    def extract_output(self, accumulator):
+        return self.sort_and_dedup(accumulator)
+
+
 class CreateTaggedRecords(beam.PTransform):
 
     def __init__(self, min_required_positions, thin=True):
@@ -58,59 +124,37 @@ class CreateTaggedRecords(beam.PTransform):
         self.thin = thin
         self.FIVE_MINUTES = datetime.timedelta(minutes=5)
 
-    def order_by_timestamp(self, item):
-        ident, records = item
-        records = sorted(records,  key=lambda x: (x.timestamp, x.speed, x.location))
-        return ident, records
-
-    def dedup_by_timestamp(self, item):
-        key, source = item
-        seen = set()
-        sink = []
-        for x in sorted(source, key=lambda x: (x.timestamp, x.speed, x.location)):
-            if x.timestamp not in seen:
-                sink.append(x)
-                seen.add(x.timestamp)
-        return (key, sink)
-
-    def long_enough(self, item):
-        ident, records = item
-        return len(records) >= self.min_required_positions
-
-    def thin_records(self, item):
-        if not self.thin:
-            return item
-        ident, records = item
-        last_timestamp = datetime.datetime(datetime.MINYEAR, 1, 1)
-        thinned = []
-        for rcd in records:
-            if (rcd.timestamp - last_timestamp) >= self.FIVE_MINUTES:
-                last_timestamp = rcd.timestamp
-                thinned.append(rcd)
-        return ident, thinned
-
-    def tag_records(self, item):
+    def tag_and_thin(self, item):
+        # Filter out short series, tag location records with the latest
+        # destination and thin them, all in a single pass over the records.
         ident, records = item
+        if len(records) < self.min_required_positions:
+            return
         dest = ''
+        # Earliest timestamp of the next record to keep. Comparing against this
+        # avoids building a timedelta for every record; it is only advanced
+        # when a record is kept.
+        next_timestamp = None
         tagged = []
         for rcd in records:
             if isinstance(rcd, VesselInfoRecord):
                 # TODO: normalize here rather than later. And cache normalization in dictionary
                 dest = rcd.destination
             elif isinstance(rcd, VesselLocationRecord):
-                tagged.append(rcd._replace(destination=dest))
+                if self.thin:
+                    if next_timestamp is not None and rcd.timestamp < next_timestamp:
+                        continue
+                    next_timestamp = rcd.timestamp + self.FIVE_MINUTES
+                # Much cheaper than `rcd._replace(destination=dest)`
+                tagged.append(VesselLocationRecord(rcd.timestamp, rcd.location, rcd.speed, dest))
             else:
                 raise RuntimeError('unknown type {}'.format(type(rcd)))
-        return (ident, tagged)
+        yield (ident, tagged)
 
     def expand(self, vessel_records):
         return (vessel_records
-            | beam.GroupByKey()
-            | beam.Map(self.order_by_timestamp)
-            | beam.Map(self.dedup_by_timestamp)
-            | beam.Filter(self.long_enough)
-            | beam.Map(self.tag_records)
-            | beam.Map(self.thin_records)
+            | beam.CombinePerKey(SortedUniqueRecords())
+            | beam.FlatMap(self.tag_and_thin)
             )
 
 
@@ -128,15 +172,6 @@ def load_config(path):
     return config
 
 
-def mean(iterable):
-    n = 0
-    total = 0.0
-    for x in iterable:
-        total += x
-        n += 1
-    return (total / n) if n else 0
-
-
 class LatLon(
     namedtuple("LatLon", ["lat", "lon"])):
 
@@ -150,6 +185,76 @@ class LatLon(
         return cellid
 
 
+S2_TOKENS_MIN_VECTORIZED = 20
+
+
+def s2_tokens(locations, scale):
+    """S2 cell tokens at `scale` for a sequence of LatLon
+
+    Equivalent to `[x.S2CellId(scale).to_token() for x in locations]`, but
+    only the conversion to unit vectors is done per point; the face
+    projection and Hilbert curve steps are done in bulk with numpy.
+    """
+    if len(locations) < S2_TOKENS_MIN_VECTORIZED:
+        # For a handful of points the fixed cost of the numpy calls below
+        # outweighs the per-point cost of s2sphere.
+        return [x.S2CellId(scale).to_token() for x in locations]
+    xyz = np.empty((len(locations), 3))
+    last_loc = None
+    for k, loc in enumerate(locations):
+        # Stationary vessels report the same position over and over.
+        if loc == last_loc:
+            xyz[k] = xyz[k - 1]
+            continue
+        last_loc = loc
+        # Use `math` here, as s2sphere does, so that points on cell
+        # boundaries land in exactly the same cell.
+        phi = math.radians(loc.lat)
+        theta = math.radians(loc.lon)
+        cosphi = math.cos(phi)
+        xyz[k] = (math.cos(theta) * cosphi, math.sin(theta) * cosphi, math.sin(phi))
+    x, y, z = xyz.T
+    ax, ay, az = abs(x), abs(y), abs(z)
+    face = np.where(ax > ay, np.where(ax > az, 0, 2), np.where(ay > az, 1, 2))
+    face = np.where(xyz[np.arange(len(face)), face] < 0, face + 3, face)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = np.choose(face, [y / x, -x / y, -x / z, z / x, z / y, -y / z])
+        v = np.choose(face, [z / x, z / y, -y / z, y / x, -x / y, -x / z])
+        i, j = [np.where(w >= 0, 0.5 * np.sqrt(1 + 3 * w), 1 - 0.5 * np.sqrt(1 - 3 * w))
+                    for w in (u, v)]
+    max_size = s2sphere.CellId.MAX_SIZE
+    i, j = [np.clip(np.floor(max_size * s), 0, max_size - 1).astype(np.uint64) for s in (i, j)]
+
+    face = face.astype(np.uint64)
+    n = face << np.uint64(s2sphere.CellId.POS_BITS - 1)
+    bits = face & np.uint64(SWAP_MASK)
+    mask = np.uint64((1 << LOOKUP_BITS) - 1)
+    for k in range(7, -1, -1):
+        shift = np.uint64(k * LOOKUP_BITS)
+        bits += ((i >> shift) & mask) << np.uint64(LOOKUP_BITS + 2)
+        bits += ((j >> shift) & mask) << np.uint64(2)
+        bits = _S2_LOOKUP_POS[bits]
+        n |= (bits >> np.uint64(2)) << np.uint64(2 * k * LOOKUP_BITS)
+        bits &= np.uint64(SWAP_MASK | INVERT_MASK)
+    ids = n * np.uint64(2) + np.uint64(1)
+
+    lsb = np.uint64(s2sphere.CellId.lsb_for_level(scale))
+    ids = (ids & ~(lsb - np.uint64(1))) | lsb
+    return [format(x, '016x').rstrip('0') for x in ids.tolist()]
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def s2_neighborhood(token, scale):
+    """Tokens of the cell `token` and all of its neighbors at `scale`
+
+    Many anchorages share the same coarse visit cell, so the neighbor
+    expansion is cached by token.
+    """
+    cellid = s2sphere.CellId.from_token(token)
+    return (token,) + tuple(x.to_token() for x in cellid.get_all_neighbors(scale))
+
+
 def add_pipeline_defaults(pipeline_args, name):
 
     defaults = {
@@ -1,12 +1,44 @@
 import math
+from math import sin, cos, asin, sqrt
+import numpy as np
 
 EARTH_RADIUS = 6371 # kilometers
 
+# Length of a degree of latitude, and a lower bound on the distance covered
+# by a degree of latitude difference.
+KM_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
 inf = float('inf')
 assert math.isinf(inf)
 
+# `x * _RADIANS` is exactly `math.radians(x)`; halving the constant is exact too.
+_RADIANS = math.pi / 180.0
+_HALF_RADIANS = _RADIANS / 2
+
 def distance(a, b):
-    h = ( math.sin(math.radians(a.lat - b.lat) / 2) ** 2 
-        + math.cos(math.radians(a.lat)) * math.cos(math.radians(b.lat)) * math.sin(math.radians((a.lon - b.lon)) / 2) ** 2)
-    h = min(h, 1)
-    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+    s_lat = sin((a.lat - b.lat) * _HALF_RADIANS)
+    s_lon = sin((a.lon - b.lon) * _HALF_RADIANS)
+    h = s_lat ** 2 + cos(a.lat * _RADIANS) * cos(b.lat * _RADIANS) * s_lon ** 2
+    if h > 1:
+        h = 1
+    return 2 * EARTH_RADIUS * asin(sqrt(h))
+
+def unit_vector(loc):
+    """Point on the unit sphere for `loc`, as an (x, y, z) tuple"""
+    lat = loc.lat * _RADIANS
+    lon = loc.lon * _RADIANS
+    cos_lat = cos(lat)
+    return (cos_lat * cos(lon), cos_lat * sin(lon), sin(lat))
+
+def chord2_for_distance(d):
+    """Squared chord length on the unit sphere for a distance of `d` km"""
+    return 4 * sin(d / (2 * EARTH_RADIUS)) ** 2
+
+def distance_array(lats, lons, b):
+    """Distances from each point in `lats`, `lons` to `b`, as an array"""
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    h = ( np.sin(np.radians(lats - b.lat) / 2) ** 2
+        + np.cos(np.radians(lats)) * math.cos(math.radians(b.lat)) * np.sin(np.radians(lons - b.lon) / 2) ** 2)
+    h = np.minimum(h, 1)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(h))
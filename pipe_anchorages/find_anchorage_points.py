@@ -2,12 +2,13 @@ from __future__ import absolute_import, print_function, division
 
 import s2sphere
 import math
+import numpy as np
 from collections import namedtuple, Counter
 
 import apache_beam as beam
 
 from . import common as cmn
-from .distance import distance
+from .distance import distance_array, EARTH_RADIUS
 from .port_name_filter import normalized_valid_names
 
 StationaryPeriod = namedtuple("StationaryPeriod", 
@@ -17,14 +18,58 @@ ActiveAndStationary = namedtuple("ActiveAndStationary",
     ['active_records', 'stationary_periods'])
 
 
+class Track(namedtuple("Track", ['lats', 'lons', 'coss', 'lat_list', 'lon_list', 'cos_list'])):
+    """Positions of a track in radians, both as arrays and as lists
+
+    The lists allow fast scalar access in Python, the arrays vectorized access.
+    """
+
+    __slots__ = ()
+
+    @staticmethod
+    def from_degrees(lats, lons):
+        lats = np.radians(lats)
+        lons = np.radians(lons)
+        coss = np.cos(lats)
+        return Track(lats, lons, coss, lats.tolist(), lons.tolist(), coss.tolist())
+
+
 class FindAnchoragePoints(beam.PTransform):
 
-    def __init__(self, min_duration, max_distance, min_unique_vessels, fishing_vessel_list):
+    SCALAR_LOOKAHEAD = 4
+
+    def __init__(self, min_duration, max_distance, min_unique_vessels, fishing_vessel_set):
         self.min_duration = min_duration
         self.max_distance = max_distance
         self.min_unique_vessels = min_unique_vessels
-        self.fishing_vessel_list = fishing_vessel_list
-        self.fishing_vessel_set = None
+        self.fishing_vessel_set = fishing_vessel_set
+
+    def _find_departure(self, track, start):
+        # Index of the first record after `start` that is more than `max_distance`
+        # from the record at `start`, or the track length if there is none. Moving vessels
+        # usually depart within a few records, so check those one at a time, then
+        # compare in geometrically growing blocks for stationary vessels.
+        # Comparisons are on the haversine term `h`, skipping the arcsin.
+        h_max = math.sin(self.max_distance / (2 * EARTH_RADIUS)) ** 2
+        lat0, lon0, cos0 = track.lat_list[start], track.lon_list[start], track.cos_list[start]
+        n = len(track.lat_list)
+        lo = min(start + 1 + self.SCALAR_LOOKAHEAD, n)
+        for i in range(start + 1, lo):
+            h = (math.sin((track.lat_list[i] - lat0) / 2) ** 2 +
+                 track.cos_list[i] * cos0 * math.sin((track.lon_list[i] - lon0) / 2) ** 2)
+            if h > h_max:
+                return i
+        size = 16
+        while lo < n:
+            hi = min(lo + size, n)
+            h = (np.sin((track.lats[lo:hi] - lat0) / 2) ** 2 +
+                 track.coss[lo:hi] * cos0 * np.sin((track.lons[lo:hi] - lon0) / 2) ** 2)
+            away = h > h_max
+            if away.any():
+                return lo + int(away.argmax())
+            lo = hi
+            size *= 2
+        return n
 
     def split_on_movement(self, item):
         # extract long stationary periods from the record. Stationary periods are returned 
@@ -32,53 +77,60 @@ class FindAnchoragePoints(beam.PTransform):
         # and end points of the period. The remaining points will summarized and returned
         # as a stationary period
         ssvid, records = item
+        records = list(records)
 
         active_records = []
         stationary_periods = []
-        current_period = []
-
-        for rcd in records:
-            if current_period:
-                first_rcd = current_period[0]
-                if distance(rcd.location, first_rcd.location) > self.max_distance:
-                    if current_period[-1].timestamp - first_rcd.timestamp > self.min_duration:
-                        active_records.append(first_rcd)
-                        if current_period[-1] != first_rcd:
-                            active_records.append(current_period[-1])
-                        num_points = len(current_period)
-                        duration = current_period[-1].timestamp - first_rcd.timestamp
-                        mean_lat = sum(x.location.lat for x in current_period) / num_points
-                        mean_lon = sum(x.location.lon for x in current_period) / num_points
-                        mean_location = cmn.LatLon(mean_lat, mean_lon)
-                        rms_drift_radius = math.sqrt(sum(distance(x.location, mean_location)**2 for x in current_period) / num_points)
-                        stationary_periods.append(StationaryPeriod(mean_location, 
-                                                                   first_rcd.timestamp,
-                                                                   duration, 
-                                                                   rms_drift_radius,
-                                                                   first_rcd.destination))
-                    else:
-                        active_records.extend(current_period)
-                    current_period = []
-            current_period.append(rcd)
-        active_records.extend(current_period)
+
+        n = len(records)
+        lats = np.fromiter((x.location.lat for x in records), float, n)
+        lons = np.fromiter((x.location.lon for x in records), float, n)
+        track = Track.from_degrees(lats, lons)
+
+        start = 0
+        while start < n:
+            end = self._find_departure(track, start)
+            if end == n:
+                active_records.extend(records[start:])
+                break
+            first_rcd = records[start]
+            last_rcd = records[end - 1]
+            duration = last_rcd.timestamp - first_rcd.timestamp
+            if duration > self.min_duration:
+                active_records.append(first_rcd)
+                if last_rcd != first_rcd:
+                    active_records.append(last_rcd)
+                period_lats = lats[start:end]
+                period_lons = lons[start:end]
+                mean_location = cmn.LatLon(float(period_lats.mean()), float(period_lons.mean()))
+                drift = distance_array(period_lats, period_lons, mean_location)
+                rms_drift_radius = math.sqrt((drift ** 2).mean())
+                stationary_periods.append(StationaryPeriod(mean_location, 
+                                                           first_rcd.timestamp,
+                                                           duration, 
+                                                           rms_drift_radius,
+                                                           first_rcd.destination))
+            else:
+                active_records.extend(records[start:end])
+            start = end
 
         return (ssvid, ActiveAndStationary(active_records=active_records, 
                                           stationary_periods=stationary_periods))
 
     def extract_stationary(self, item):
         ssvid, combined = item
-        return [(sp.location.S2CellId(cmn.ANCHORAGES_S2_SCALE).to_token(), (ssvid, sp)) 
-                        for sp in combined.stationary_periods] 
+        s2ids = cmn.s2_tokens([sp.location for sp in combined.stationary_periods],
+                              cmn.ANCHORAGES_S2_SCALE)
+        return [(s2id, (ssvid, sp)) for (s2id, sp) in zip(s2ids, combined.stationary_periods)]
 
     def extract_active(self, item):
         ssvid, combined = item
-        return [(ar.location.S2CellId(cmn.ANCHORAGES_S2_SCALE).to_token(), (ssvid, ar)) 
-                        for ar in combined.active_records] 
+        s2ids = cmn.s2_tokens([ar.location for ar in combined.active_records],
+                              cmn.ANCHORAGES_S2_SCALE)
+        return [(s2id, (ssvid, ar)) for (s2id, ar) in zip(s2ids, combined.active_records)]
 
-    def create_anchorage_pts(self, item, fishing_vessel_list):
-        if self.fishing_vessel_set is None:
-            self.fishing_vessel_set = set(fishing_vessel_list)
-        value = AnchoragePoint.from_cell_visits(item, self.fishing_vessel_set)
+    def create_anchorage_pts(self, item, fishing_vessel_set):
+        value = AnchoragePoint.from_cell_visits(item, fishing_vessel_set)
         return [] if (value is None) else [value]
 
     def has_enough_vessels(self, item):
@@ -91,8 +143,10 @@ class FindAnchoragePoints(beam.PTransform):
         active =     combined | beam.FlatMap(self.extract_active)
         return ((stationary, active)
             | beam.CoGroupByKey()
-            | beam.FlatMap(self.create_anchorage_pts, self.fishing_vessel_list)
+            | beam.FlatMap(self.create_anchorage_pts, self.fishing_vessel_set)
             | beam.Filter(self.has_enough_vessels)
+            # Most cells are filtered out above, so only look up neighbors afterwards.
+            | beam.Map(AnchoragePoint.with_neighbor_s2ids)
             )
 
 
@@ -123,33 +177,40 @@ class AnchoragePoint(namedtuple("AnchoragePoint", ['mean_location',
         fishing_vessels = set()
         vessels = set()
         total_squared_drift_radius = 0.0
-        active_ssvids = set(md for (md, loc) in active_points)
+        active_ssvids = set()
+        active_ssvid_days = set()
+        for (md, loc) in active_points:
+            active_ssvids.add(md)
+            active_ssvid_days.add((md, loc.timestamp.date()))
         active_ssvid_count = len(active_ssvids)
-        active_days = len(set([(md, loc.timestamp.date()) for (md, loc) in active_points]))
+        active_days = len(active_ssvid_days)
         stationary_days = 0
         stationary_fishing_days = 0
+        destinations = []
 
         for (ssvid, sp) in stationary_periods:
             n += 1
+            destinations.append(sp.destination)
             total_lat += sp.location.lat
             total_lon += sp.location.lon
             vessels.add(ssvid)
-            stationary_days += sp.duration.total_seconds() / (24.0 * 60.0 * 60.0)
+            days = sp.duration.total_seconds() / (24.0 * 60.0 * 60.0)
+            stationary_days += days
             if ssvid in fishing_vessel_set:
                 fishing_vessels.add(ssvid)
-                stationary_fishing_days += sp.duration.total_seconds() / (24.0 * 60.0 * 60.0)
-            total_squared_drift_radius += sp.rms_drift_radius ** 2
-        all_destinations = normalized_valid_names(sp.destination for (md, sp) in stationary_periods)
+                stationary_fishing_days += days
+            total_squared_drift_radius += sp.rms_drift_radius * sp.rms_drift_radius
+        all_destinations = normalized_valid_names(destinations)
 
         total_ssvid_count = len(vessels | active_ssvids)
 
         if n:
-            neighbor_s2ids = tuple(s2sphere.CellId.from_token(s2id).get_all_neighbors(cmn.ANCHORAGES_S2_SCALE))
             loc = cmn.LatLon(total_lat / n, total_lon / n)
 
-            all_destinations = list(all_destinations)
-            if len(all_destinations):
-                [(top_destination, top_count)] = Counter(all_destinations).most_common(1)
+            # most_common(1) is a single O(N) max over the counts, not a sort.
+            destination_counts = Counter(all_destinations)
+            if destination_counts:
+                [(top_destination, top_count)] = destination_counts.most_common(1)
             else:
                 top_destination = ''
 
@@ -161,7 +222,8 @@ class AnchoragePoint(namedtuple("AnchoragePoint", ['mean_location',
                         rms_drift_radius =  math.sqrt(total_squared_drift_radius / n),    
                         top_destination = top_destination,
                         s2id = s2id,
-                        neighbor_s2ids = neighbor_s2ids,
+                        # Filled in by `with_neighbor_s2ids`, only for points that are kept
+                        neighbor_s2ids = None,
                         active_ssvids = active_ssvid_count,
                         total_ssvids = total_ssvid_count,
                         stationary_ssvid_days = stationary_days,
@@ -171,6 +233,10 @@ class AnchoragePoint(namedtuple("AnchoragePoint", ['mean_location',
         else:
             return None
 
+    def with_neighbor_s2ids(self):
+        cellid = s2sphere.CellId.from_token(self.s2id)
+        return self._replace(neighbor_s2ids=tuple(cellid.get_all_neighbors(cmn.ANCHORAGES_S2_SCALE)))
+
 
 
 
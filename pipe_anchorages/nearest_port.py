@@ -4,15 +4,17 @@ import os
 import logging
 import math
 from collections import namedtuple
-from .distance import distance, EARTH_RADIUS, inf
+import numpy as np
+from .distance import distance_array, KM_PER_DEGREE, inf
 
 Port = namedtuple("Port", ["iso3", "label", "sublabel", "lat", "lon"])
 
 
 class PortFinder(object):
 
+    INITIAL_SEARCH_DEGREES = 1.0
+
     def __init__(self, path):
-        self.ports_near = {}
         self.ports = []
         with open(path) as f:
             reader = csv.DictReader(f)
@@ -23,24 +25,52 @@ class PortFinder(object):
                                            sublabel=row['sublabel'],
                                            lat=float(row['latitude']),
                                            lon=float(row['longitude'])))
-                except StandardError as err:
+                except Exception as err:
                     logging.fatal("Could not parse row: '{}'".format(row))
                     raise
+        # Struct of arrays copy of the port locations so that distances to
+        # all ports can be computed in a single vectorized pass.
+        self.lats = np.array([p.lat for p in self.ports], dtype=np.float64)
+        self.lons = np.array([p.lon for p in self.ports], dtype=np.float64)
+        # Index the ports by latitude so that only a band of nearby ports
+        # needs to be searched.
+        self.lat_order = np.argsort(self.lats, kind='stable')
+        self.sorted_lats = self.lats[self.lat_order]
 
     def __call__(self, loc):
         return self.find_nearest_port_and_distance(loc)[0]
 
 
     def find_nearest_port_and_distance(self, loc):
-        min_p = None
-        min_dist = inf
-        for p in self.ports:
-            dist = distance(p, loc)
-            if dist > min_dist:
-                continue
-            min_p = p
-            min_dist = dist
-        return min_p, min_dist
+        if not self.ports:
+            return None, inf
+        # A port more than `width` degrees of latitude away is at least
+        # `width * KM_PER_DEGREE` km away, so if the nearest port in the band
+        # is closer than that, it is the nearest port overall. Otherwise,
+        # widen the band to the distance found and search again.
+        width = self.INITIAL_SEARCH_DEGREES
+        while True:
+            if width > 180:
+                # The band covers every latitude, so search all ports. This also
+                # ends the search for a latitude that falls in no band, such as NaN.
+                ndxs = self.lat_order
+            else:
+                start = np.searchsorted(self.sorted_lats, loc.lat - width, side='left')
+                end = np.searchsorted(self.sorted_lats, loc.lat + width, side='right')
+                if start == end:
+                    width *= 4
+                    continue
+                ndxs = self.lat_order[start:end]
+            dists = distance_array(self.lats[ndxs], self.lons[ndxs], loc)
+            min_dist = dists.min()
+            if math.isnan(min_dist):
+                # Every comparison with NaN fails, so the linear scan ended on the last port.
+                return self.ports[-1], float(min_dist)
+            if min_dist <= width * KM_PER_DEGREE or len(ndxs) == len(self.ports):
+                # On ties, prefer the last port in the list, as the linear scan did.
+                ndx = ndxs[dists == min_dist].max()
+                return self.ports[ndx], float(min_dist)
+            width = min_dist / KM_PER_DEGREE * (1 + 1e-9)
 
    
 
@@ -1,10 +1,25 @@
-import json as ujson
 import apache_beam as beam
 from apache_beam import typehints
 from apache_beam import PTransform
 import datetime
 import pytz
 
+try:
+    import orjson
+
+    def json_dumps(x):
+        # orjson does not serialize namedtuples directly, so fall back to plain tuples.
+        return orjson.dumps(x, default=tuple)
+
+    json_loads = orjson.loads
+except ImportError:
+    import json
+
+    def json_dumps(x):
+        return json.dumps(x).encode('utf-8')
+
+    json_loads = json.loads
+
 
 epoch = datetime.datetime.utcfromtimestamp(0).replace(tzinfo=pytz.utc)
 
@@ -31,7 +46,12 @@ class NamedtupleCoder(beam.coders.Coder):
 
     @classmethod
     def encode(cls, value):
-        return ujson.dumps(cls._encode(value))
+        # The schema is fixed, so convert the time fields in place in a plain
+        # row rather than building a replacement dict and calling `_replace`.
+        row = list(value)
+        for i in cls._time_indices:
+            row[i] = _datetime_to_s(row[i])
+        return json_dumps(row)
 
     @classmethod
     def _decode(cls, value):
@@ -40,13 +60,17 @@ class NamedtupleCoder(beam.coders.Coder):
 
     @classmethod
     def decode(cls, value):
-        return cls._decode(cls.target(*ujson.loads(value)))
+        row = json_loads(value)
+        for i in cls._time_indices:
+            row[i] = _s_to_datetime(row[i])
+        return cls.target._make(row)
 
     def is_deterministic(self):
         return True 
 
     @classmethod
     def register(cls):
+        cls._time_indices = tuple(cls.target._fields.index(x) for x in cls.time_fields)
         beam.coders.registry.register_coder(cls.target, cls)
 
         @typehints.with_input_types(tuple)
@@ -27,6 +27,9 @@ def create_queries(args, start_date, end_date):
             CAST(UNIX_MICROS(timestamp) AS FLOAT64) / 1000000 AS timestamp
     FROM `{table}*`
     WHERE _table_suffix BETWEEN '{start:%Y%m%d}' AND '{end:%Y%m%d}'
+      AND lat IS NOT NULL
+      AND lon IS NOT NULL
+      AND speed IS NOT NULL
       {filter_text}
     """
     start_window = start_date
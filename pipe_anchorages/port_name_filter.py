@@ -1,3 +1,4 @@
+import functools
 import re
 
 
@@ -6,20 +7,22 @@ punctuation = re.compile(r"[\W +]+")
 
 number = re.compile(r"\d+")
 
-invalid_prefixes = set([
+# Tuples rather than sets so that `str.startswith` / `str.endswith`
+# can check them all in a single call.
+invalid_prefixes = (
 "RESCUE", "FISHFARMS", "TLF ", "TEL ", "CALL ", "PHONE", "FISHING", "MOB ",
 "SAR ", "SEARCH AND RESCUE", "POLICE", "ON DUTY", "WORKING", "SURVEYING", "SEA TRIAL", 
 "CH ", "VHF CH", "PESCA ", "DREDGE "
-])
+)
 
 
-invalid_suffixes = set([
+invalid_suffixes = (
 "FOR ORDER", "TOWING", "CRUISING", "OIL FIELDS", "OIL FIELD", "DREDGE", "PARADE", "TRADE", "WORK", " TRIAL",
-"PESCA", "PECHE", "OIL FIELDS", "HARBOR DUTY", " ESCORT", "SAILING"
-    ])
+"PESCA", "PECHE", "HARBOR DUTY", " ESCORT", "SAILING"
+    )
 
 
-known_false_destinations = set([
+known_false_destinations = frozenset([
 'CITY',
 'B # A',
 'AN',
@@ -62,20 +65,23 @@ def is_valid_name(x):
     x = number.sub('#', x)
     if len(x) <= 1:
         return False
-    for p in invalid_prefixes:
-        if x.startswith(p):
-            return False
-    for s in invalid_suffixes:
-        if x.endswith(s):
-            return False
+    if x.startswith(invalid_prefixes) or x.endswith(invalid_suffixes):
+        return False
     if x in known_false_destinations:
         return False
     return True
 
 
+# The same raw destinations are reported over and over, so remember
+# the outcome for each rather than rerunning the regexes every time.
+@functools.lru_cache(maxsize=1 << 16)
+def normalized_valid_name(x):
+    x = normalize(x)
+    return x if is_valid_name(x) else None
+
 def normalized_valid_names(seq):
     for x in seq:
-        x = normalize(x)
-        if is_valid_name(x):
+        x = normalized_valid_name(x)
+        if x is not None:
             yield x
 
@@ -1,6 +1,13 @@
 from collections import namedtuple
 from .objects.namedtuples import s_to_datetime
-import datetime
+import functools
+
+
+# Positions from many vessels share the same timestamps, so cache the
+# conversion rather than building a new datetime for every message.
+@functools.lru_cache(maxsize=1 << 16)
+def parse_timestamp(x):
+    return s_to_datetime(x)
 
 def is_location_message(msg):
     return (
@@ -11,9 +18,9 @@ def is_location_message(msg):
 
 def has_valid_location(msg):
     return (
-        -90  <= msg['lat']   <= 90  and
-        -180 <= msg['lon']   <= 180 and
-        0    <= msg['speed'] <= 102.2
+        -90.0  <= msg['lat']   <= 90.0  and
+        -180.0 <= msg['lon']   <= 180.0 and
+        0.0    <= msg['speed'] <= 102.2
     )
 
 def has_destination(msg):
@@ -22,14 +29,26 @@ def has_destination(msg):
 
 class VesselRecord(object):
 
+    # Without this every record subclass would carry a per-instance __dict__.
+    __slots__ = ()
+
     @staticmethod
     def tagged_from_msg(msg):
 
         # `ident` is some sort of vessel identifier, currently either `ssvid`, `seg_id`, 'vessel_id' or 'track_id'  
         ident = msg['ident']
 
-        if is_location_message(msg) and has_valid_location(msg):
-            return (ident, VesselLocationRecord.from_msg(msg))
+        # Equivalent to `is_location_message(msg) and has_valid_location(msg)`,
+        # but looks up each field only once on this hot path. Float bounds
+        # avoid the slower mixed int / float comparisons.
+        lat, lon, speed = msg.get('lat'), msg.get('lon'), msg.get('speed')
+        if (lat is not None and lon is not None and speed is not None and
+                -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0 and 0.0 <= speed <= 102.2):
+            from .common import LatLon
+            # Positional arguments, since keyword construction of a
+            # namedtuple is about twice as slow.
+            return (ident, VesselLocationRecord(parse_timestamp(msg['timestamp']),
+                                                LatLon(lat, lon), speed, None))
         elif has_destination(msg):
             return (ident, VesselInfoRecord.from_msg(msg))
         else:
@@ -46,7 +65,7 @@ class InvalidRecord(
     @staticmethod
     def from_msg(msg):
         return InvalidRecord(
-            timestamp=s_to_datetime(msg['timestamp']),
+            timestamp=parse_timestamp(msg['timestamp']),
             )
 
 
@@ -58,13 +77,8 @@ class VesselInfoRecord(
 
     @staticmethod
     def from_msg(msg):
-        timestamp=None
-        try:
-            timestamp=datetime.datetime.strptime(msg['timestamp'], '%Y-%m-%d %H:%M:%S.%f %Z')
-        except ValueError:
-            timestamp=datetime.datetime.strptime(msg['timestamp'], '%Y-%m-%d %H:%M:%S %Z')
         return VesselInfoRecord(
-                timestamp=s_to_datetime(msg['timestamp']),
+                timestamp=parse_timestamp(msg['timestamp']),
                 destination=msg['destination']
                 )
 
@@ -80,7 +94,7 @@ class VesselLocationRecord(
         from .common import LatLon
         latlon = LatLon(msg['lat'], msg['lon'])
         return VesselLocationRecord(
-            timestamp=s_to_datetime(msg['timestamp']),
+            timestamp=parse_timestamp(msg['timestamp']),
             location=latlon,
             speed=msg['speed'],
             destination=None
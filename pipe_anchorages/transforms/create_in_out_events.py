@@ -2,13 +2,14 @@ from __future__ import absolute_import, print_function, division
 
 import datetime
 from datetime import timedelta
-from collections import namedtuple
+from collections import namedtuple, defaultdict
+import numpy as np
 import pytz
 import apache_beam as beam
 from apache_beam import pvalue
 
 from pipe_anchorages import common as cmn
-from pipe_anchorages.distance import distance, inf
+from pipe_anchorages.distance import distance, inf, unit_vector, chord2_for_distance, KM_PER_DEGREE
 from pipe_anchorages.objects.visit_event import VisitEvent
 from pipe_anchorages.objects.namedtuples import s_to_datetime
 import logging
@@ -21,6 +22,13 @@ class CreateInOutEvents(beam.PTransform):
     AT_SEA  = "AT_SEA"
     STOPPED = "STOPPED"
 
+    # Maximum number of record / anchorage pairs compared at once
+    MAX_BLOCK_SIZE = 100000
+    # Maximum number of cells whose anchorage unit vectors are cached
+    MAX_CACHED_CELLS = 1 << 14
+    # Cells with fewer anchorages than this are compared against all of them
+    MIN_LAT_PREFILTER = 32
+
     in_port_states = (IN_PORT, STOPPED)
     all_states = (IN_PORT, AT_SEA, STOPPED)
 
@@ -54,6 +62,12 @@ class CreateInOutEvents(beam.PTransform):
         self.anchorages = anchorages
         self.anchorage_entry_dist = anchorage_entry_dist
         self.anchorage_exit_dist = anchorage_exit_dist
+        self.max_anchorage_dist = max(anchorage_entry_dist, anchorage_exit_dist)
+        # With some slack so that no anchorage within the radius is missed due to
+        # rounding, since chord lengths are found from dot products, which lose
+        # precision for nearby points; the true distance is checked afterwards.
+        self.max_anchorage_chord2 = chord2_for_distance(self.max_anchorage_dist) * (1 + 1e-9) + 1e-12
+        self.max_anchorage_lat_diff = self.max_anchorage_dist / KM_PER_DEGREE * (1 + 1e-9)
         self.stopped_begin_speed = stopped_begin_speed
         self.stopped_end_speed = stopped_end_speed
         self.min_gap = timedelta(minutes=min_gap_minutes)
@@ -62,6 +76,12 @@ class CreateInOutEvents(beam.PTransform):
         self.start_date = start_date
         assert isinstance(end_date, datetime.date)
         self.end_date = end_date
+        # The date window as UTC datetime bounds, so that per-record checks compare
+        # timestamps directly rather than building and comparing dates.
+        self.window_start = self.date_as_datetime(start_date)
+        self.window_end = self.date_as_datetime(end_date + timedelta(days=1))
+        self.prev_day_start = self.date_as_datetime(start_date - timedelta(days=1))
+        self._anchorage_xyz_cache = {}
 
     def _is_in_port(self, state, dist):
         if dist <= self.anchorage_entry_dist:
@@ -79,15 +99,74 @@ class CreateInOutEvents(beam.PTransform):
         else:
             return (state == self.STOPPED) 
 
-    def _anchorage_distance(self, loc, anchorages):
-        closest = None
-        min_dist = inf
-        for anch in sorted(anchorages, key=lambda x: x.s2id):
-            dist = distance(loc, anch.mean_location)
-            if dist < min_dist:
-                min_dist = dist
-                closest = anch
-        return closest, min_dist
+    def _anchorage_xyz(self, s2id, anchorages):
+        # The anchorage map is a side input shared by every segment processed by
+        # a worker, so the unit vectors (and latitudes) of a cell's anchorages are
+        # only built once. The cached list is checked by identity in case the map
+        # is replaced.
+        cached = self._anchorage_xyz_cache.get(s2id)
+        if cached is not None and cached[0] is anchorages:
+            return cached[1], cached[2]
+        if len(self._anchorage_xyz_cache) >= self.MAX_CACHED_CELLS:
+            self._anchorage_xyz_cache.clear()
+        xyz = np.array([unit_vector(x.mean_location) for x in anchorages])
+        lats = np.array([x.mean_location.lat for x in anchorages])
+        self._anchorage_xyz_cache[s2id] = (anchorages, xyz, lats)
+        return xyz, lats
+
+    def _nearest_anchorages(self, records, s2ids, anchorage_map):
+        # For each record, the closest anchorage in its cell and the distance to it,
+        # or `(None, inf)` if there is none within `max_anchorage_dist`, since
+        # farther anchorages never put a vessel in port.
+        #
+        # Records are processed a cell at a time, comparing every record in the
+        # cell against every anchorage at once with a single matrix product of
+        # their unit vectors. The squared chord length is `2 - 2 * dot`, so the
+        # largest dot product is the closest anchorage, and only that one gets its
+        # true distance computed. In cells with many anchorages, those whose
+        # latitude is too far from every record in a block to be within
+        # `max_anchorage_dist` are dropped first; the rest keep their order.
+        # Anchorages are already sorted by s2id by `CreateTaggedAnchorages` and
+        # `argmax` picks the first maximum, so ties go to the lowest s2id.
+        ports = [None] * len(records)
+        dists = [inf] * len(records)
+        by_cell = defaultdict(list)
+        for ndx, s2id in enumerate(s2ids):
+            by_cell[s2id].append(ndx)
+        for s2id, ndxs in by_cell.items():
+            anchorages = anchorage_map.get(s2id)
+            if not anchorages:
+                continue
+            anchorage_xyz, anchorage_lats = self._anchorage_xyz(s2id, anchorages)
+            prefilter = len(anchorages) >= self.MIN_LAT_PREFILTER
+            # Bound the size of the records x anchorages array of dot products.
+            block_size = max(1, self.MAX_BLOCK_SIZE // len(anchorages))
+            for start in range(0, len(ndxs), block_size):
+                block = ndxs[start:start + block_size]
+                candidates = None
+                candidate_xyz = anchorage_xyz
+                if prefilter:
+                    block_lats = [records[i].location.lat for i in block]
+                    candidates = np.flatnonzero(
+                        (anchorage_lats >= min(block_lats) - self.max_anchorage_lat_diff) &
+                        (anchorage_lats <= max(block_lats) + self.max_anchorage_lat_diff))
+                    if not len(candidates):
+                        continue
+                    candidate_xyz = anchorage_xyz[candidates]
+                    candidates = candidates.tolist()
+                record_xyz = np.array([unit_vector(records[i].location) for i in block])
+                dots = record_xyz @ candidate_xyz.T
+                nearest = dots.argmax(axis=1)
+                chord2 = 2 - 2 * dots[np.arange(len(block)), nearest]
+                in_range = chord2 <= self.max_anchorage_chord2
+                for i, j, ok in zip(block, nearest.tolist(), in_range.tolist()):
+                    if ok:
+                        port = anchorages[j if candidates is None else candidates[j]]
+                        dist = distance(records[i].location, port.mean_location)
+                        if dist <= self.max_anchorage_dist:
+                            ports[i] = port
+                            dists[i] = dist
+        return ports, dists
 
     def _extract_records(self, items):
         n_records = len(items['records'])
@@ -99,6 +178,13 @@ class CreateInOutEvents(beam.PTransform):
             raise ValueError('grouped_states_and_records should have 0 or 1 sets of records')
 
     def parse_datetime(self, text):
+        # Fast path for the fixed layout BigQuery emits, for example
+        # '2021-05-04 12:20:42.798437 UTC' or '2021-05-04 12:20:42 UTC'.
+        n = len(text)
+        if text.endswith(' UTC') and (n == 23 or (n == 30 and text[19] == '.')):
+            return datetime.datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                                     int(text[11:13]), int(text[14:16]), int(text[17:19]),
+                                     int(text[20:26]) if n == 30 else 0, tzinfo=pytz.utc)
         # TODO: should check that %Z is what we think it is....
         naive = None
         try:
@@ -108,6 +194,9 @@ class CreateInOutEvents(beam.PTransform):
         return naive.replace(tzinfo=pytz.utc)
 
     def parse_date(self, text):
+        # Fast path for the fixed 'YYYY-MM-DD' layout BigQuery emits.
+        if len(text) == 10 and text[4] == text[7] == '-':
+            return datetime.date(int(text[0:4]), int(text[5:7]), int(text[8:10]))
         return datetime.datetime.strptime(text, '%Y-%m-%d').date()
 
     def date_as_datetime(self, date):
@@ -158,21 +247,22 @@ class CreateInOutEvents(beam.PTransform):
                           last_timestamp=last_timestamp,
                          )
 
-    def _yield_states(self, state_info_map):
+    def _yield_states(self, seg_id, state_info_map):
         date = self.start_date
         state_info = state_info_map[date]
         while date <= self.end_date:
-            state_info = state_info_map.get(date, state_info).copy()
-            state_info['date'] = self.date_as_datetime(date)
-            if state_info['state'] is not None:
-                yield pvalue.TaggedOutput('state', state_info)
+            state_info = state_info_map.get(date, state_info)
+            state, active_port, last_timestamp = state_info
+            if state is not None:
+                yield pvalue.TaggedOutput('state', self._build_state(seg_id, self.date_as_datetime(date),
+                                                                     state, active_port, last_timestamp))
             date += timedelta(days=1)
 
     def _possibly_yield_gap_beg(self, seg_id, last_timestamp, last_state, next_timestamp, active_port):
         if next_timestamp - last_timestamp >= self.min_gap:
             if last_state in self.in_port_states:
                 evt_timestamp = last_timestamp + self.min_gap
-                if self.start_date <= evt_timestamp.date() <= self.end_date:
+                if self.window_start <= evt_timestamp < self.window_end:
                     assert evt_timestamp <= next_timestamp
                     rcd = PseudoRcd(location=cmn.LatLon(None, None), timestamp=evt_timestamp)  
                     yield self._build_event(active_port, rcd, seg_id, self.EVT_GAP_BEG, last_timestamp)
@@ -188,23 +278,28 @@ class CreateInOutEvents(beam.PTransform):
     def create_in_out_events(self, grouped_states_and_records, anchorage_map):
         seg_id, items = grouped_states_and_records
         last_timestamp, last_state, active_port  = self._extract_state_info(items, anchorage_map)
-        prev_state_info = self._build_state(seg_id, self.start_date, last_state, active_port, last_timestamp)
-        state_info_map = {self.start_date : prev_state_info}
+        # The last (state, active_port, last_timestamp) seen on each date. These are
+        # only turned into state dicts in `_yield_states`, once per day.
+        state_info_map = {self.start_date : (last_state, active_port, last_timestamp)}
+
+        records = self._extract_records(items)
+        s2ids = cmn.s2_tokens([x.location for x in records], cmn.VISITS_S2_SCALE)
+
+        ports, dists = self._nearest_anchorages(records, s2ids, anchorage_map)
 
+        day_start = day_end = None
         rcd = None
-        for rcd in self._extract_records(items):
+        for rcd, port, dist in zip(records, ports, dists):
 
-            s2id = rcd.location.S2CellId(cmn.VISITS_S2_SCALE).to_token()
-            port, dist = self._anchorage_distance(rcd.location, anchorage_map.get(s2id, []))
             is_in_port = self._is_in_port(last_state, dist)
             active_port = port if is_in_port else active_port
             is_stopped = self._is_stopped(last_state, rcd.speed)
             state = self._compute_state(is_in_port, is_stopped)
 
-            if last_timestamp is not None:
+            # Gaps are rare, so only look for gap events when there is one.
+            if last_timestamp is not None and rcd.timestamp - last_timestamp >= self.min_gap:
                 if (last_state in self.in_port_states and 
-                    rcd.timestamp - last_timestamp >= self.min_gap and
-                    last_timestamp.date() >= self.start_date - timedelta(days=1)):
+                    last_timestamp >= self.prev_day_start):
                     # if is_in_port: # and last_state in (self.IN_PORT, self.STOPPED): # Current logic
                         yield self._build_event(active_port, rcd, seg_id, self.EVT_GAP_END, last_timestamp)
                 yield from self._possibly_yield_gap_beg(seg_id, last_timestamp, last_state, rcd.timestamp, active_port)
@@ -212,15 +307,18 @@ class CreateInOutEvents(beam.PTransform):
             for event_type in self.transition_map[(last_state, state)]:
                 yield self._build_event(active_port, rcd, seg_id, event_type, last_timestamp)
 
-            date = rcd.timestamp.date()
-            state_info_map[date] = self._build_state(seg_id, date, state, active_port, rcd.timestamp)
+            if day_start is None or not (day_start <= rcd.timestamp < day_end):
+                date = rcd.timestamp.date()
+                day_start = self.date_as_datetime(date)
+                day_end = day_start + timedelta(days=1)
+            state_info_map[date] = (state, active_port, rcd.timestamp)
 
             last_timestamp = rcd.timestamp
             last_state = state
 
         end_time = datetime.datetime.combine(self.end_date, datetime.time.max, tzinfo=pytz.utc)
         yield from self._possibly_yield_gap_beg(seg_id, last_timestamp, last_state, end_time, active_port)
-        yield from self._yield_states(state_info_map)
+        yield from self._yield_states(seg_id, state_info_map)
 
 
 
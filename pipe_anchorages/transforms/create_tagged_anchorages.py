@@ -16,19 +16,24 @@ class CreateTaggedAnchorages(beam.PTransform):
                 port_name = obj['label'])
 
     def tag_anchorage_with_s2ids(self, anchorage):
-        central_cell_id = anchorage.mean_location.S2CellId(cmn.VISITS_S2_SCALE)
+        central_token = anchorage.mean_location.S2CellId(cmn.VISITS_S2_SCALE).to_token()
         ids = {anchorage.s2id}
-        ids.add(central_cell_id.to_token())
-        for cell_id in central_cell_id.get_all_neighbors(cmn.VISITS_S2_SCALE):
-            ids.add(cell_id.to_token())
+        ids.update(cmn.s2_neighborhood(central_token, cmn.VISITS_S2_SCALE))
         for s2id in ids:
             yield (s2id, anchorage)
 
 
+    def sort_by_s2id(self, item):
+        # Sorted once here so that consumers scanning a cell's anchorages for
+        # the closest one break ties consistently without re-sorting.
+        s2id, anchorages = item
+        return (s2id, sorted(anchorages, key=lambda x: x.s2id))
+
     def expand(self, anchorages_text):
         return (anchorages_text
             | beam.Map(self.dict_to_psuedo_anchorage)
             | beam.FlatMap(self.tag_anchorage_with_s2ids)
             | beam.GroupByKey()
+            | beam.Map(self.sort_by_s2id)
             )
 
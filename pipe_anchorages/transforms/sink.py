@@ -1,6 +1,5 @@
-import datetime
+import functools
 import logging
-import pytz
 from apache_beam import PTransform
 from apache_beam import Map
 from apache_beam import io
@@ -10,48 +9,59 @@ from ..objects.namedtuples import epoch
 from ..schema.port_event import build as build_event_schema, build_event_state_schema
 from ..schema.named_anchorage import build as build_named_anchorage_schema
 
-epoch = datetime.datetime.utcfromtimestamp(0).replace(tzinfo=pytz.utc)
+
+_EPOCH_ORDINAL = epoch.toordinal()
+
+# The schemas never change, so each is built once, on first use, and shared.
+_event_schema = functools.lru_cache(maxsize=None)(build_event_schema)
+_event_state_schema = functools.lru_cache(maxsize=None)(build_event_state_schema)
+_named_anchorage_schema = functools.lru_cache(maxsize=None)(build_named_anchorage_schema)
+
+# State rows share a handful of dates, so cache the seconds and text for each one.
+@functools.lru_cache(maxsize=4096)
+def _date_to_s(date):
+    # Seconds from the epoch to midnight UTC on `date`, by whole days.
+    return float((date.toordinal() - _EPOCH_ORDINAL) * 86400)
+
+
+@functools.lru_cache(maxsize=4096)
+def _date_to_text(date):
+    return f'{date.year:04d}-{date.month:02d}-{date.day:02d}'
 
 
 class EventSink(PTransform):
     def __init__(self, table, temp_location, project):
         self.table = table
+        self.dataset, self.table_name = table.split('.')
         self.temp_location = temp_location
         self.project = project
 
     def expand(self, xs):
 
-        def as_dict(x):
-            d = x._asdict()
-            return d
-
-        def encode_datetimes_to_s(x):
+        # Converting to a dict, encoding the datetimes and timestamping are done
+        # in a single step so each event only passes through one Map.
+        def encode(x):
+            x = x._asdict()
 
             for field in ['timestamp', 'last_timestamp']:
                 if x[field] is not None:
                     x[field] = (x[field] - epoch).total_seconds()
 
-            return x
-
-
-        dataset, table = self.table.split('.')
-
+            return TimestampedValue(x, x['timestamp'])
 
         sink = WriteToBigQueryDateSharded(
             temp_gcs_location=self.temp_location,
-            dataset=dataset,
-            table=table,
+            dataset=self.dataset,
+            table=self.table_name,
             project=self.project,
             write_disposition="WRITE_TRUNCATE",
-            schema=build_event_schema()
+            schema=_event_schema()
             )
 
-        logging.info('sink params: \n\t%s\n\t%s\n\t%s\n\t%s', self.temp_location, dataset, table, self.project)
+        logging.info('sink params: \n\t%s\n\t%s\n\t%s\n\t%s', self.temp_location, self.dataset, self.table_name, self.project)
 
         return (xs 
-            | Map(as_dict)
-            | Map(encode_datetimes_to_s)
-            | Map(lambda x: TimestampedValue(x, x['timestamp'])) 
+            | Map(encode)
             | sink
             )
 
@@ -59,8 +69,13 @@ class EventSink(PTransform):
 class EventStateSink(PTransform):
     def __init__(self, table, temp_location, project):
         self.table = table
+        self.dataset, self.table_name = table.split('.')
         self.temp_location = temp_location
         self.project = project
+        # Every row is built by `CreateInOutEvents._build_state`, so checking the
+        # layout of the first one a worker sees is enough to catch a change to it
+        # without paying for the checks on every row.
+        self._layout_checked = False
 
     def expand(self, xs):
 
@@ -71,45 +86,55 @@ class EventStateSink(PTransform):
             for field in ['last_timestamp']:
                 x[field] = (x[field] - epoch).total_seconds()
 
-            dt = datetime.datetime.combine(x['date'], datetime.time.min, tzinfo=pytz.utc)
-            ts_field = (dt - epoch).total_seconds()
+            ts_field = _date_to_s(x['date'])
 
             for field in ['date']:
-                x[field] = '{:%Y-%m-%d}'.format(x[field])
-
-
-            assert isinstance(x['seg_id'], str)
-            assert isinstance(x['date'], (str))
-            assert isinstance(x['state'], str)
-            assert isinstance(x['last_timestamp'], (int, float))
-            assert x['active_port'] is None or isinstance(x['active_port'], str), x['active_port']
-            assert len(x) == 5
+                x[field] = _date_to_text(x[field])
 
-            return ts_field, x
 
-        dataset, table = self.table.split('.')
+            if not self._layout_checked:
+                assert isinstance(x['seg_id'], str)
+                assert isinstance(x['date'], (str))
+                assert isinstance(x['state'], str)
+                assert isinstance(x['last_timestamp'], (int, float))
+                assert x['active_port'] is None or isinstance(x['active_port'], str), x['active_port']
+                assert len(x) == 5
+                self._layout_checked = True
 
+            return TimestampedValue(x, ts_field)
 
         sink = WriteToBigQueryDateSharded(
             temp_gcs_location=self.temp_location,
-            dataset=dataset,
-            table=table,
+            dataset=self.dataset,
+            table=self.table_name,
             project=self.project,
             write_disposition="WRITE_TRUNCATE",
-            schema=build_event_state_schema()
+            schema=_event_state_schema()
             )
 
 
-        logging.info('sink params: \n\t%s\n\t%s\n\t%s\n\t%s', self.temp_location, dataset, table, self.project)
+        logging.info('sink params: \n\t%s\n\t%s\n\t%s\n\t%s', self.temp_location, self.dataset, self.table_name, self.project)
 
         return (xs 
             | Map(encode_datetimes_to_s)
-            | Map(lambda x: TimestampedValue(x[1], x[0]))
             | sink
             )
 
 
 
+def _build_table_schema(spec):
+    schema = io.gcp.internal.clients.bigquery.TableSchema()
+
+    for name, type in spec.items():
+        field = io.gcp.internal.clients.bigquery.TableFieldSchema()
+        field.name = name
+        field.type = type
+        field.mode = 'nullable'
+        schema.fields.append(field)
+
+    return schema   
+
+
 class AnchorageSink(PTransform):
     def __init__(self, table, write_disposition):
         self.table = table
@@ -152,27 +177,20 @@ class AnchorageSink(PTransform):
 
     @property
     def schema(self):
-
-        def build_table_schema(spec):
-            schema = io.gcp.internal.clients.bigquery.TableSchema()
-
-            for name, type in spec.items():
-                field = io.gcp.internal.clients.bigquery.TableFieldSchema()
-                field.name = name
-                field.type = type
-                field.mode = 'nullable'
-                schema.fields.append(field)
-
-            return schema   
-
-        return build_table_schema(self.spec)
+        return _anchorage_schema()
 
     def expand(self, xs):        
-        return xs | Map(self.encode) | io.Write(io.gcp.bigquery.BigQuerySink(
-            table=self.table,
+        return xs | Map(self.encode) | io.WriteToBigQuery(
+            self.table,
             write_disposition=self.write_disposition,
-            schema=self.schema
-            ))
+            schema=self.schema,
+            method=io.WriteToBigQuery.Method.FILE_LOADS
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def _anchorage_schema():
+    return _build_table_schema(AnchorageSink.spec)
 
 
 
@@ -207,11 +225,12 @@ class NamedAnchorageSink(PTransform):
 
     @property
     def schema(self):
-        return build_named_anchorage_schema()
+        return _named_anchorage_schema()
 
     def expand(self, xs):        
-        return xs | Map(self.encode) | io.Write(io.gcp.bigquery.BigQuerySink(
-            table=self.table,
+        return xs | Map(self.encode) | io.WriteToBigQuery(
+            self.table,
             write_disposition=self.write_disposition,
-            schema=self.schema
-            ))
+            schema=self.schema,
+            method=io.WriteToBigQuery.Method.FILE_LOADS
+            )
@@ -0,0 +1,80 @@
+import random
+from pipe_anchorages import common
+from pipe_anchorages.records import VesselLocationRecord, VesselInfoRecord
+from pipe_anchorages.objects.namedtuples import s_to_datetime
+
+
+def test_s2_tokens():
+    random.seed(42)
+    locations = [common.LatLon(random.uniform(-90, 90), random.uniform(-180, 180))
+                    for _ in range(1000)]
+    # Include points on the poles, the dateline and face boundaries
+    locations += [common.LatLon(lat, lon) for lat in (-90, -45, 0, 45, 90)
+                                          for lon in (-180, -135, -90, -45, 0, 45, 90, 135, 180)]
+    for scale in (common.VISITS_S2_SCALE, common.ANCHORAGES_S2_SCALE):
+        expected = [x.S2CellId(scale).to_token() for x in locations]
+        assert common.s2_tokens(locations, scale) == expected
+
+
+def test_s2_tokens_empty():
+    assert common.s2_tokens([], common.ANCHORAGES_S2_SCALE) == []
+
+
+def test_s2_tokens_few():
+    locations = [common.LatLon(10, 20), common.LatLon(-45, 135)]
+    expected = [x.S2CellId(common.VISITS_S2_SCALE).to_token() for x in locations]
+    assert common.s2_tokens(locations, common.VISITS_S2_SCALE) == expected
+
+
+def test_s2_neighborhood():
+    loc = common.LatLon(29.9667462525, 122.4396281067)
+    cellid = loc.S2CellId(common.VISITS_S2_SCALE)
+    expected = [cellid.to_token()] + [x.to_token() for x in
+                    cellid.get_all_neighbors(common.VISITS_S2_SCALE)]
+    assert list(common.s2_neighborhood(cellid.to_token(), common.VISITS_S2_SCALE)) == expected
+
+
+def test_sorted_unique_records():
+    ts = [s_to_datetime(x) for x in (0, 0, 60, 120, 120, 120, 180)]
+    records = [VesselLocationRecord(t, common.LatLon(0, i), i, None) for (i, t) in enumerate(ts)]
+    fn = common.SortedUniqueRecords()
+    accumulators = []
+    for chunk in (records[5:], records[:2], records[2:5]):
+        acc = fn.create_accumulator()
+        for rcd in reversed(chunk):
+            acc = fn.add_input(acc, rcd)
+        accumulators.append(fn.compact(acc))
+    deduped = fn.extract_output(fn.merge_accumulators(accumulators))
+    assert [x.speed for x in deduped] == [0, 2, 3, 6]
+
+
+def test_s2_tokens_repeated_locations():
+    locations = ([common.LatLon(10, 20)] * 3 + [common.LatLon(-10, 20)] * 2 + [common.LatLon(10, 20)]) * 5
+    assert len(locations) >= common.S2_TOKENS_MIN_VECTORIZED
+    expected = [x.S2CellId(common.VISITS_S2_SCALE).to_token() for x in locations]
+    assert common.s2_tokens(locations, common.VISITS_S2_SCALE) == expected
+
+
+def test_tag_and_thin():
+    ts = [s_to_datetime(x) for x in (0, 60, 300, 400, 600)]
+    records = [VesselLocationRecord(t, common.LatLon(0, i), i, None) for (i, t) in enumerate(ts)]
+    records.insert(2, VesselInfoRecord(ts[1], 'PORT A'))
+    tagger = common.CreateTaggedRecords(min_required_positions=2)
+    [(key, tagged)] = tagger.tag_and_thin(('a', records))
+    assert key == 'a'
+    assert [(x.speed, x.destination) for x in tagged] == [(0, ''), (2, 'PORT A'), (4, 'PORT A')]
+    assert list(common.CreateTaggedRecords(min_required_positions=7).tag_and_thin(('a', records))) == []
+    [(key, tagged)] = common.CreateTaggedRecords(1, thin=False).tag_and_thin(('a', records))
+    assert len(tagged) == 5
+
+
+def test_records_from_msg():
+    creator = common.CreateVesselRecords(destination=None)
+    msg = {'ident': '1', 'timestamp': 0.0, 'lat': 10.0, 'lon': 20.0, 'speed': 1.0}
+    [(ident, rcd)] = creator.records_from_msg(msg)
+    assert ident == '1'
+    assert rcd == VesselLocationRecord(s_to_datetime(0.0), common.LatLon(10.0, 20.0), 1.0, None)
+    msg = {'ident': '1', 'timestamp': 0.0, 'lat': None, 'lon': None, 'speed': None}
+    assert list(creator.records_from_msg(msg)) == []
+    msg = {'ident': 1, 'timestamp': 0.0, 'lat': 10.0, 'lon': 20.0, 'speed': 1.0}
+    assert list(creator.records_from_msg(msg)) == []
@@ -0,0 +1,65 @@
+import datetime
+import random
+import pytz
+from pipe_anchorages import common
+from pipe_anchorages.distance import distance
+from pipe_anchorages.objects.pseudo_anchorage import PseudoAnchorage
+from pipe_anchorages.transforms.create_in_out_events import CreateInOutEvents, PseudoRcd
+
+
+def test_parse_datetime():
+    evts = CreateInOutEvents(None, 0.5, 4.0, 0.2, 0.5, 60,
+                             datetime.date(2021, 5, 4), datetime.date(2021, 5, 5))
+    for text in ['2021-05-04 12:20:42.798437 UTC', '2021-05-04 12:20:42 UTC',
+                 '2021-05-04 12:20:42.7 UTC']:
+        try:
+            expected = datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S.%f %Z')
+        except ValueError:
+            expected = datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S %Z')
+        assert evts.parse_datetime(text) == expected.replace(tzinfo=pytz.utc)
+    assert evts.parse_datetime('2021-05-04 12:20:42.798437 UTC').tzinfo is pytz.utc
+
+
+def test_parse_date():
+    evts = CreateInOutEvents(None, 0.5, 4.0, 0.2, 0.5, 60,
+                             datetime.date(2021, 5, 4), datetime.date(2021, 5, 5))
+    for text in ['2021-05-04', '1999-12-31', '2021-5-4']:
+        assert evts.parse_date(text) == datetime.datetime.strptime(text, '%Y-%m-%d').date()
+
+
+def test_nearest_anchorages():
+    random.seed(11)
+    evts = CreateInOutEvents(None, 0.5, 4.0, 0.2, 0.5, 60,
+                             datetime.date(2021, 5, 4), datetime.date(2021, 5, 5))
+    evts.MAX_BLOCK_SIZE = 500
+    anchorages = [PseudoAnchorage(common.LatLon(random.uniform(9.9, 10.1), random.uniform(19.9, 20.1)),
+                                  '{:04d}'.format(i), 'P') for i in range(100)]
+    records = [PseudoRcd(common.LatLon(random.uniform(9.8, 10.2), random.uniform(19.8, 20.2)), None)
+                    for _ in range(50)]
+    s2ids = [random.choice('abc') for _ in records]
+    # The second map changes the anchorages of cell 'a', which must not be
+    # served from the cached unit vectors of the first.
+    for anchorage_map in [{'a': anchorages[:5], 'b': anchorages},
+                          {'a': anchorages[5:10], 'b': anchorages}]:
+        ports, dists = evts._nearest_anchorages(records, s2ids, anchorage_map)
+        for rcd, s2id, port, dist in zip(records, s2ids, ports, dists):
+            candidates = anchorage_map.get(s2id, [])
+            expected = min([distance(rcd.location, x.mean_location) for x in candidates] + [float('inf')])
+            if expected < 4.0:
+                assert port == min(candidates, key=lambda x: distance(rcd.location, x.mean_location))
+                assert dist == expected
+            else:
+                assert (port, dist) == (None, float('inf'))
+
+
+def test_nearest_anchorages_at_entry_distance():
+    anchorage = PseudoAnchorage(common.LatLon(10.0, 20.0), '0001', 'P')
+    rcd = PseudoRcd(common.LatLon(10.03, 20.01), None)
+    entry_dist = distance(rcd.location, anchorage.mean_location)
+    # Entry distance larger than exit distance, with the record exactly at the entry distance
+    evts = CreateInOutEvents(None, entry_dist, entry_dist / 2, 0.2, 0.5, 60,
+                             datetime.date(2021, 5, 4), datetime.date(2021, 5, 5))
+    ports, dists = evts._nearest_anchorages([rcd], ['a'], {'a': [anchorage]})
+    assert ports == [anchorage]
+    assert dists == [entry_dist]
+    assert evts._is_in_port(evts.AT_SEA, dists[0])
@@ -30,6 +30,19 @@ def test_distances():
             continue
         assert distance.distance(phx, locations[key]) == distances[key]
 
-
-
-
+def test_distance_array():
+    phx = locations['Phoenix']
+    keys = sorted(locations)
+    lats = [locations[k].lat for k in keys]
+    lons = [locations[k].lon for k in keys]
+    dists = distance.distance_array(lats, lons, phx)
+    for key, dist in zip(keys, dists):
+        assert abs(dist - distance.distance(locations[key], phx)) < 1e-6
+
+def test_chord2_for_distance():
+    phx = distance.unit_vector(locations['Phoenix'])
+    for key in sorted(locations):
+        xyz = distance.unit_vector(locations[key])
+        chord2 = sum((a - b) ** 2 for (a, b) in zip(xyz, phx))
+        expected = distance.chord2_for_distance(distance.distance(locations[key], locations['Phoenix']))
+        assert abs(chord2 - expected) < 1e-9
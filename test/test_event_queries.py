@@ -18,6 +18,9 @@ def test_create_queries_1():
             CAST(UNIX_MICROS(timestamp) AS FLOAT64) / 1000000 AS timestamp
     FROM `SOURCE_TABLE*`
     WHERE _table_suffix BETWEEN '20160101' AND '20160101'
+      AND lat IS NOT NULL
+      AND lon IS NOT NULL
+      AND speed IS NOT NULL
       
     """]
     
@@ -28,6 +31,9 @@ def test_create_queries_2():
             CAST(UNIX_MICROS(timestamp) AS FLOAT64) / 1000000 AS timestamp
     FROM `SOURCE_TABLE*`
     WHERE _table_suffix BETWEEN '20120501' AND '20150126'
+      AND lat IS NOT NULL
+      AND lon IS NOT NULL
+      AND speed IS NOT NULL
       
     """,
     """
@@ -35,6 +41,9 @@ def test_create_queries_2():
             CAST(UNIX_MICROS(timestamp) AS FLOAT64) / 1000000 AS timestamp
     FROM `SOURCE_TABLE*`
     WHERE _table_suffix BETWEEN '20150127' AND '20170515'
+      AND lat IS NOT NULL
+      AND lon IS NOT NULL
+      AND speed IS NOT NULL
       
     """
         ]
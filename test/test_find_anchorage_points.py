@@ -0,0 +1,22 @@
+import datetime
+import pytz
+from pipe_anchorages import common
+from pipe_anchorages.records import VesselLocationRecord
+from pipe_anchorages.find_anchorage_points import FindAnchoragePoints
+
+
+def test_split_on_movement():
+    t0 = datetime.datetime(2020, 1, 1, tzinfo=pytz.utc)
+    # Anchored for 100 positions, move away, then anchored for 3 positions
+    lats = [10.0 + 0.0001 * (i % 3) for i in range(100)] + [11.0] * 3
+    records = [VesselLocationRecord(t0 + datetime.timedelta(minutes=10 * i),
+                                    common.LatLon(lat, 20.0), 0.0, 'PORT A')
+                    for (i, lat) in enumerate(lats)]
+    finder = FindAnchoragePoints(datetime.timedelta(hours=12), 0.5, 1, frozenset())
+    ssvid, result = finder.split_on_movement(('1', records))
+    assert ssvid == '1'
+    [period] = result.stationary_periods
+    assert period.start_time == t0
+    assert period.duration == datetime.timedelta(minutes=990)
+    assert abs(period.location.lat - 10.0001) < 1e-4
+    assert result.active_records == [records[0], records[99]] + records[100:]
@@ -0,0 +1,14 @@
+import datetime
+import pytz
+
+from pipe_anchorages.objects.visit_event import VisitEvent, VisitEventCoder
+
+
+def test_visit_event_coder_round_trip():
+    ts = datetime.datetime(2020, 1, 2, 3, 4, 5, 123456, tzinfo=pytz.utc)
+    evt = VisitEvent(anchorage_id='89c19c9b', lat=10.5, lon=20.25, vessel_lat=10.51,
+                     vessel_lon=20.26, seg_id='seg_1', timestamp=ts, event_type='PORT_ENTRY',
+                     last_timestamp=ts - datetime.timedelta(seconds=37))
+    encoded = VisitEventCoder.encode(evt)
+    assert encoded.startswith(b'["89c19c9b",10.5,20.25,10.51,20.26,"seg_1",1577934245.123456,')
+    assert VisitEventCoder.decode(encoded) == evt
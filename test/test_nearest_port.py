@@ -1,4 +1,6 @@
 import os
+import math
+import random
 from collections import namedtuple
 from pipe_anchorages.common import LatLon
 from pipe_anchorages.distance import distance
@@ -16,3 +18,23 @@ def test_nearest_port():
     assert wpi_finder(LatLon(59.3293, 18.0686)) == Port(label='STOCKHOLM', iso3='SWE', sublabel='',  lat=59.333332999999996, lon=18.05)
     assert wpi_finder(LatLon(-90, 0)) == Port(label='MCMURDO STATION', iso3='ATA', sublabel='', lat=-77.85, lon=166.65)
 
+
+def test_nearest_port_matches_linear_scan():
+    random.seed(7)
+    for _ in range(100):
+        loc = LatLon(random.uniform(-90, 90), random.uniform(-180, 180))
+        port, dist = wpi_finder.find_nearest_port_and_distance(loc)
+        expected = min(distance(p, loc) for p in wpi_finder.ports)
+        assert abs(dist - expected) < 1e-6
+        assert abs(distance(port, loc) - expected) < 1e-6
+
+
+def test_nearest_port_unusual_latitudes():
+    for loc in [LatLon(100.0, 20.0), LatLon(-95.0, -120.0)]:
+        port, dist = wpi_finder.find_nearest_port_and_distance(loc)
+        expected = min(distance(p, loc) for p in wpi_finder.ports)
+        assert abs(dist - expected) < 1e-6
+    for loc in [LatLon(float('nan'), 20.0), LatLon(10.0, float('nan'))]:
+        port, dist = wpi_finder.find_nearest_port_and_distance(loc)
+        assert port == wpi_finder.ports[-1]
+        assert math.isnan(dist)
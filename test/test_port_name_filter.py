@@ -175,3 +175,8 @@ def test_is_valid_name():
 def test_normalize():
     assert port_name_filter.normalize("SHANG  HAI") == "SHANG HAI"
 
+
+
+def test_normalized_valid_name():
+    assert port_name_filter.normalized_valid_name("SHANG  HAI") == "SHANG HAI"
+    assert port_name_filter.normalized_valid_name("TEL:91679631") is None
@@ -7,6 +7,7 @@ import pytz
 from pipe_anchorages import common
 from pipe_anchorages.records import is_location_message, has_valid_location
 from pipe_anchorages.records import InvalidRecord
+from pipe_anchorages.records import parse_timestamp
 from pipe_anchorages.records import VesselRecord
 from pipe_anchorages.records import VesselLocationRecord
 
@@ -37,6 +38,11 @@ def test_date_parsing_records():
     InvalidRecord(timestamp=datetime.datetime(2021, 4, 26, 6, 0, 12, tzinfo=pytz.UTC)),
     InvalidRecord(timestamp=datetime.datetime(2021, 5, 4, 12, 20, 42, 798437, tzinfo=pytz.UTC))]
 
+def test_parse_timestamp():
+    ts = datetime.datetime(2021, 5, 4, 12, 20, 42, 798437, tzinfo=pytz.utc)
+    assert parse_timestamp(ts.timestamp()) == ts
+    assert parse_timestamp(ts.timestamp()) is parse_timestamp(ts.timestamp())
+
 def test_is_location_message():
     assert [is_location_message(x) for x in examples_msgs] == [1, 0, 1, 1, 0]
 
@@ -53,6 +59,10 @@ class TestVesselLocationRecord(object):
                     destination=None, 
                     speed=15.8999996185)
 
+    def test_no_instance_dict(self):
+        (md, obj) = VesselRecord.tagged_from_msg(examples_msgs[0])
+        assert not hasattr(obj, '__dict__')
+
     def test_pickle(self):
         (md, obj) = VesselRecord.tagged_from_msg(examples_msgs[0])
         assert pickle.loads(pickle.dumps(obj)) == obj
@@ -61,3 +71,11 @@ class TestVesselLocationRecord(object):
 
 
 
+
+def test_tagged_from_msg_matches_predicates():
+    for msg in examples_msgs:
+        md, obj = VesselRecord.tagged_from_msg(msg)
+        expected = is_location_message(msg) and has_valid_location(msg)
+        assert isinstance(obj, VesselLocationRecord) == expected
+        if expected:
+            assert obj == VesselLocationRecord.from_msg(msg)
@@ -3,6 +3,7 @@ import pytest
 import json
 import datetime
 import pickle
+import pytz
 import six
 import s2sphere
 
@@ -62,3 +63,15 @@ class TestAnchorageSink(object):
         for k, v in encoded.items():
             assert type_map[type(v)] == asink.spec[k], (k, type(v), asink.spec[k])
 
+
+
+def test_date_to_s():
+    for date in [datetime.date(1970, 1, 1), datetime.date(2021, 5, 4),
+                 datetime.datetime(2021, 5, 4, tzinfo=pytz.utc)]:
+        midnight = datetime.datetime(date.year, date.month, date.day, tzinfo=pytz.utc)
+        assert sink._date_to_s(date) == (midnight - sink.epoch).total_seconds()
+
+
+def test_date_to_text():
+    assert sink._date_to_text(datetime.date(2021, 5, 4)) == '2021-05-04'
+    assert sink._date_to_text(datetime.datetime(999, 12, 31, tzinfo=pytz.utc)) == '0999-12-31'